@@ -1,5 +1,3 @@
-import firebase_admin
-from firebase_admin import firestore
 from blockchain import Blockchain
 import wallets
 import binascii
@@ -8,50 +6,56 @@ import json
 
 CREDENTIALS_PATH = 'discoin-ae632-firebase-adminsdk-olger-6d18986a1e.json'
 
-credentials = firebase_admin.credentials.Certificate(CREDENTIALS_PATH)
+USER_NAME = 'Chris'
 
 
-default_app = firebase_admin.initialize_app(credentials)
+def main():
+    import firebase_admin
+    from firebase_admin import credentials, firestore
 
-db = firestore.client()
+    default_app = firebase_admin.initialize_app(
+        credentials.Certificate(CREDENTIALS_PATH))
 
-USER_NAME = 'Chris'
+    db = firestore.client()
+
+    wallet_ref = db.collection('wallets').document(USER_NAME)
+    key_ref = db.collection('public_keys').document(USER_NAME)
 
-wallet_ref = db.collection('wallets').document(USER_NAME)
-key_ref = db.collection('public_keys').document(USER_NAME)
+    wallet_doc = wallet_ref.get()
+    key_doc = key_ref.get()
 
-wallet_doc = wallet_ref.get()
-key_doc = key_ref.get()
+    if wallet_doc.exists:
+        wallet = wallet_doc.to_dict()
+        public_key = key_doc.to_dict()
 
-if wallet_doc.exists:
-    wallet = wallet_doc.to_dict()
-    public_key = key_doc.to_dict()
+        encoded_private_key = wallet["private_key"].encode()
+        private_key_pair = wallets.build_private_key(encoded_private_key)
 
-    encoded_private_key = wallet["private_key"].encode()
-    private_key_pair = wallets.build_private_key(encoded_private_key)
+        encoded_public_key = public_key["key"].encode()
+        public_key_pair = wallets.build_public_key(encoded_public_key)
 
-    encoded_public_key = public_key["key"].encode()
-    public_key_pair = wallets.build_public_key(encoded_public_key)
+        # print(key_pair.exportKey())
 
-    # print(key_pair.exportKey())
+        transaction = {
+            "sender": "Alex",
+            "receiver": "John",
+            "amount": 3100
+        }
 
-    transaction = {
-        "sender": "Alex",
-        "receiver": "John",
-        "amount": 3100
-    }
+        tx_encoded = json.dumps(transaction, sort_keys=True).encode()
+        signature = wallets.sign_transaction(tx_encoded, private_key_pair)
 
-    tx_encoded = json.dumps(transaction, sort_keys=True).encode()
-    signature = wallets.sign_transaction(tx_encoded, private_key_pair)
+        # print('original:', signature)
 
-    # print('original:', signature)
+        hex_sig = binascii.hexlify(signature)
 
-    hex_sig = binascii.hexlify(signature)
+        print(signature == binascii.unhexlify(hex_sig))
 
-    print(signature == binascii.unhexlify(hex_sig))
+        if wallets.verify_transaction(tx_encoded, public_key_pair, signature):
+            print('Valid transaction')
 
-    if wallets.verify_transaction(tx_encoded, public_key_pair, signature):
-        print('Valid transaction')
 
+if __name__ == '__main__':
+    main()
 
-# TODO: Add function to create transaction so that it includes a signature
\ No newline at end of file
+# TODO: Add function to create transaction so that it includes a signature
@@ -0,0 +1,26 @@
+from blockchain import block_hash, merkle_root
+
+
+def mine(_blockchain, txs, parent=None):
+    """Returns a valid block holding txs on top of parent, the tip by default"""
+    prev_block = parent or _blockchain.get_last_block()
+
+    block = {
+        'index': str(int(prev_block["index"]) + 1),
+        'ver': 1,
+        'time': 'now',
+        'tx': txs,
+        'n_tx': len(txs),
+        'mrkl_root': merkle_root(txs),
+        'previous_hash': prev_block["hash"],
+    }
+
+    nonce = 0
+    while True:
+        block["nonce"] = str(nonce)
+        block["hash"] = block_hash(block)
+
+        if _blockchain.proof_is_valid(block["hash"]):
+            return block
+
+        nonce = nonce + 1
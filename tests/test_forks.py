@@ -0,0 +1,74 @@
+import threading
+
+from blockchain import Blockchain
+from controller import MemoryController
+from helpers import mine
+from transactions import transaction_id
+
+DIFFICULTY = 1
+
+
+def new_chain(**kwargs):
+    return Blockchain(1, DIFFICULTY, [], None, threading.Lock(), **kwargs)
+
+
+def test_longer_branch_replaces_the_tip():
+    controller = MemoryController()
+    chain = Blockchain(1, DIFFICULTY, [], controller, threading.Lock())
+    genesis = chain.get_last_block()
+
+    tx_a = {'sender': 'a', 'receiver': 'x', 'n': 1}
+    tx_b = {'sender': 'b', 'receiver': 'y', 'n': 1}
+    block_a = mine(chain, [tx_a])
+    block_b = mine(chain, [tx_b], parent=genesis)
+
+    assert chain.offer_block(block_a)
+    assert not chain.offer_block(block_b)
+    assert chain.get_block(block_b["hash"]) == block_b
+
+    block_b2 = mine(chain, [{'sender': 'b', 'n': 2}], parent=block_b)
+    assert chain.offer_block(block_b2)
+
+    assert [block["hash"] for block in chain] == \
+        [genesis["hash"], block_b["hash"], block_b2["hash"]]
+    assert chain.is_valid()
+    assert chain.get_transactions() == [tx_a]
+    assert chain.get_transaction(transaction_id(tx_a)) is None
+    assert chain.get_address_history('x') == []
+    assert chain.get_address_history('y') == [tx_b]
+
+    assert controller.get_transaction_location(transaction_id(tx_a)) is None
+    assert controller.get_transaction_location(transaction_id(tx_b)) == (1, 0)
+    assert controller.get_address_history('x') == []
+
+
+def test_branch_replaying_a_confirmed_transaction_is_refused():
+    chain = new_chain()
+    tx = {'sender': 'a', 'n': 1}
+
+    block_1 = mine(chain, [tx])
+    assert chain.offer_block(block_1)
+    assert chain.offer_block(mine(chain, [{'sender': 'a', 'n': 2}]))
+
+    # Forks off above the block confirming tx, then confirms it again
+    replay = mine(chain, [tx], parent=block_1)
+    replay_2 = mine(chain, [{'sender': 'b', 'n': 3}], parent=replay)
+    assert not chain.offer_block(replay)
+    assert not chain.offer_block(replay_2)
+
+    assert chain.get_last_block()["index"] == '2'
+
+
+def test_reorganization_below_the_prune_depth_is_refused():
+    chain = new_chain(prune_depth=1)
+    genesis = chain.get_last_block()
+
+    for i in range(3):
+        assert chain.offer_block(mine(chain, [{'sender': 'a', 'n': i}]))
+
+    branch = [genesis]
+    for i in range(4):
+        branch.append(mine(chain, [{'sender': 'b', 'n': i}], parent=branch[-1]))
+
+    assert not any(chain.offer_block(block) for block in branch[1:])
+    assert chain.get_last_block()["index"] == '3'
@@ -0,0 +1,100 @@
+import threading
+
+import pytest
+
+from blockchain import Blockchain
+from helpers import mine
+from transactions import transaction_id
+
+DIFFICULTY = 1
+
+
+def new_chain(blocks=(), **kwargs):
+    return Blockchain(1, DIFFICULTY, list(blocks), None, threading.Lock(), **kwargs)
+
+
+def build_blocks(n_blocks):
+    chain = new_chain()
+
+    for i in range(n_blocks):
+        assert chain.offer_block(mine(chain, [{'sender': 'a', 'n': i}]))
+
+    return list(chain)
+
+
+def tamper(blocks, height):
+    blocks = list(blocks)
+    blocks[height] = dict(blocks[height], tx=[{'sender': 'evil'}])
+    return blocks
+
+
+@pytest.mark.parametrize('prune_depth', [0, -1])
+def test_prune_depth_must_be_positive(prune_depth):
+    with pytest.raises(ValueError):
+        new_chain(prune_depth=prune_depth)
+
+
+def test_pruning_keeps_headers_and_drops_index_entries():
+    chain = new_chain(build_blocks(5), prune_depth=2)
+    blocks = list(chain)
+
+    assert ["tx" in block for block in blocks] == [False] * 4 + [True] * 2
+    assert all(block["hash"] for block in blocks)
+    assert [tx["n"] for tx in chain.get_address_history('a', limit=None)] == [4, 3]
+    assert chain.is_valid()
+
+
+def test_tampered_block_fails_validation_when_pruned():
+    blocks = tamper(build_blocks(5), 1)
+
+    assert not new_chain(blocks).is_valid()
+    assert not new_chain(blocks, prune_depth=2).is_valid()
+
+
+def test_checkpoint_skips_merkle_check_below_it():
+    blocks = tamper(build_blocks(5), 1)
+    checkpoints = {2: blocks[2]["hash"]}
+
+    assert new_chain(blocks, prune_depth=2, checkpoints=checkpoints).is_valid()
+
+
+def test_tampered_block_above_checkpoint_is_still_caught():
+    blocks = tamper(build_blocks(5), 3)
+    checkpoints = {2: blocks[2]["hash"]}
+
+    assert not new_chain(blocks, prune_depth=2, checkpoints=checkpoints).is_valid()
+
+
+def test_checkpoint_mismatch_fails_validation():
+    blocks = build_blocks(3)
+
+    assert not new_chain(blocks, checkpoints={2: 'not-the-hash'}).is_valid()
+    assert new_chain(blocks, checkpoints={9: 'beyond-the-tip'}).is_valid()
+
+
+def test_confirmed_transaction_stays_confirmed_after_pruning():
+    chain = new_chain(prune_depth=1)
+    tx = {'sender': 'a', 'receiver': 'b', 'amount': 1}
+
+    assert chain.offer_block(mine(chain, [tx]))
+    assert not chain.add_transaction(tx)
+
+    assert chain.offer_block(mine(chain, [{'sender': 'a', 'n': 1}]))
+    assert "tx" not in list(chain)[1]
+
+    assert chain.has_transaction(transaction_id(tx))
+    assert not chain.add_transaction(tx)
+    assert not chain.offer_block(mine(chain, [tx]))
+    assert chain.is_valid()
+
+
+def test_chain_confirming_a_transaction_twice_is_invalid():
+    chain = new_chain()
+    tx = {'sender': 'a'}
+
+    assert chain.offer_block(mine(chain, [tx]))
+    replay = mine(chain, [tx])
+    blocks = list(chain) + [replay]
+
+    assert not new_chain(blocks).is_valid()
+    assert not new_chain(blocks, prune_depth=1).is_valid()
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import threading
+
+import relay
+from blockchain import Blockchain
+from helpers import mine
+from relay import Node
+from transactions import transaction_id
+
+DIFFICULTY = 1
+
+
+class RecordingNode(Node):
+    """Node that records every transaction fetched to complete a block"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fetched = []
+
+    async def _on_blocktxn(self, peer, message):
+        self.fetched.extend(message['txs'])
+        await super()._on_blocktxn(peer, message)
+
+
+async def wait_until(predicate, timeout=5):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+
+    while not predicate():
+        assert loop.time() < deadline, 'nodes did not converge'
+        await asyncio.sleep(0.01)
+
+
+def run_network(n_nodes, scenario):
+    """Start n_nodes connected in a line and run scenario(chains, nodes)"""
+
+    async def run():
+        chains = [Blockchain(1, DIFFICULTY, [], None, threading.Lock())
+                  for _ in range(n_nodes)]
+        nodes = [RecordingNode(chain) for chain in chains]
+
+        for node in nodes:
+            await node.start()
+
+        try:
+            for prev, node in zip(nodes, nodes[1:]):
+                await node.connect(prev.host, prev.port)
+
+            await scenario(chains, nodes)
+        finally:
+            for node in nodes:
+                await node.stop()
+
+    asyncio.run(run())
+
+
+def test_block_relay_fetches_only_missing_transactions():
+
+    async def scenario(chains, nodes):
+        shared_tx = {'sender': 'a', 'receiver': 'b', 'amount': 1}
+        await nodes[0].submit_transaction(shared_tx)
+        await wait_until(lambda: all(chain.get_transactions() for chain in chains))
+
+        private_tx = {'sender': 'a', 'receiver': 'c', 'amount': 2}
+        block = mine(chains[0], [shared_tx, private_tx])
+        assert chains[0].offer_block(block)
+        await nodes[0].announce_block(block)
+
+        await wait_until(lambda: all(
+            chain.get_last_block()["hash"] == block["hash"] for chain in chains))
+
+        for chain in chains:
+            assert chain.get_transactions() == []
+
+        for node in nodes[1:]:
+            assert node.fetched == [private_tx]
+
+    run_network(4, scenario)
+
+
+def test_late_peer_catches_up_from_tip():
+
+    async def scenario(chains, nodes):
+        for i in range(3):
+            assert chains[0].offer_block(mine(chains[0], [{'n': i}]))
+
+        late_chain = Blockchain(1, DIFFICULTY, [], None, threading.Lock())
+        late_node = Node(late_chain)
+        await late_node.start()
+
+        try:
+            await late_node.connect(nodes[0].host, nodes[0].port)
+            await wait_until(lambda: late_chain.get_last_block()["hash"]
+                             == chains[0].get_last_block()["hash"])
+        finally:
+            await late_node.stop()
+
+        assert late_chain.is_valid()
+        assert len(list(late_chain)) == 4
+
+    run_network(1, scenario)
+
+
+def test_confirmed_transaction_is_not_readded():
+
+    async def scenario(chains, nodes):
+        tx = {'sender': 'a', 'receiver': 'b', 'amount': 1}
+        assert chains[0].offer_block(mine(chains[0], [tx]))
+
+        await nodes[0].submit_transaction(tx)
+        assert chains[0].get_transactions() == []
+
+    run_network(1, scenario)
+
+
+def wallet_shaped_tx(i):
+    address = f'{i:064x}'
+    utxo = {'rec_addr': address, 'amount': 500}
+
+    return {
+        'sender': address,
+        'receiver': f'{i + 1:064x}',
+        'amount': 10,
+        'in': [utxo],
+        'out': [{'rec_addr': f'{i + 1:064x}', 'amount': 10},
+                {'rec_addr': address, 'amount': 490}],
+        'sig': 'A' * 88,
+    }
+
+
+def test_large_block_is_relayed():
+
+    async def scenario(chains, nodes):
+        block = mine(chains[0], [wallet_shaped_tx(i) for i in range(300)])
+        assert chains[0].offer_block(block)
+        await nodes[0].announce_block(block)
+
+        await wait_until(lambda: chains[1].get_last_block()["hash"] == block["hash"])
+
+        assert len(nodes[1].fetched) == 300
+
+    run_network(2, scenario)
+
+
+def test_oversized_message_is_skipped_without_dropping_peer(monkeypatch):
+    monkeypatch.setattr(relay, 'MAX_MESSAGE_SIZE', 1024)
+
+    async def scenario(chains, nodes):
+        reader, writer = await asyncio.open_connection(nodes[0].host, nodes[0].port)
+
+        writer.write(b'{"type": "tx", "tx": "' + b'x' * 4096 + b'"}\n')
+        writer.write(b'{"type": "getdata", "blocks": ["0"], "txs": []}\n')
+        await writer.drain()
+
+        await reader.readline()  # the node's tip announcement
+        reply = json.loads(await reader.readline())
+
+        assert reply['type'] == 'cmpctblock'
+
+        writer.close()
+        await writer.wait_closed()
+
+    run_network(1, scenario)
+
+
+def test_pending_compact_blocks_are_capped(monkeypatch):
+    monkeypatch.setattr(relay, 'MAX_PENDING', 2)
+
+    async def scenario(chains, nodes):
+        reader, writer = await asyncio.open_connection(nodes[0].host, nodes[0].port)
+
+        for i in range(5):
+            message = {
+                'type': 'cmpctblock',
+                'header': {'hash': f'unknown-{i}', 'previous_hash': '0'},
+                'short_ids': ['deadbeef'],
+            }
+            writer.write(json.dumps(message).encode() + b'\n')
+        await writer.drain()
+
+        await wait_until(lambda: len(nodes[0]._pending) == 2)
+        await asyncio.sleep(0.05)
+
+        assert len(nodes[0]._pending) == 2
+
+        writer.close()
+        await writer.wait_closed()
+
+    run_network(1, scenario)
+
+
+def test_competing_miners_converge_on_the_longest_chain():
+
+    async def scenario(chains, nodes):
+        # Both miners find a block at height 1 before hearing of the other
+        tx_a = {'sender': 'a', 'n': 1}
+        tx_b = {'sender': 'b', 'n': 1}
+        block_a = mine(chains[0], [tx_a])
+        block_b = mine(chains[1], [tx_b])
+        assert chains[0].offer_block(block_a)
+        assert chains[1].offer_block(block_b)
+
+        await nodes[1].connect(nodes[0].host, nodes[0].port)
+
+        # Equal length, so each keeps its own tip and the other as a side block
+        await wait_until(lambda: chains[0].get_block(block_b["hash"]) is not None
+                         and chains[1].get_block(block_a["hash"]) is not None)
+        assert chains[0].get_last_block()["hash"] == block_a["hash"]
+
+        block_b2 = mine(chains[1], [{'sender': 'b', 'n': 2}])
+        assert chains[1].offer_block(block_b2)
+        await nodes[1].announce_block(block_b2)
+
+        await wait_until(lambda: all(
+            chain.get_last_block()["hash"] == block_b2["hash"] for chain in chains))
+
+        assert [block["hash"] for block in chains[0]] == \
+            [block["hash"] for block in chains[1]]
+        assert chains[0].has_transaction(transaction_id(tx_b))
+        assert not chains[0].has_transaction(transaction_id(tx_a))
+        assert chains[0].get_transactions() == [tx_a]
+
+    async def run():
+        chains = [Blockchain(1, DIFFICULTY, [], None, threading.Lock())
+                  for _ in range(2)]
+        nodes = [Node(chain) for chain in chains]
+
+        for node in nodes:
+            await node.start()
+
+        try:
+            await scenario(chains, nodes)
+        finally:
+            for node in nodes:
+                await node.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+from controller import MemoryController
+from transactions import transaction_id
+from tx_index import TransactionIndex, transaction_addresses
+
+
+def make_block(txs):
+    return {'tx': txs}
+
+
+def test_transaction_addresses_include_outputs_once():
+    tx = {
+        'sender': 'a',
+        'receiver': 'b',
+        'out': [{'rec_addr': 'b', 'amount': 1}, {'rec_addr': 'a', 'amount': 2}],
+    }
+
+    assert transaction_addresses(tx) == ['a', 'b']
+
+
+def test_locations_and_history_newest_first():
+    index = TransactionIndex()
+    txs = [{'sender': 'a', 'receiver': 'b', 'amount': i} for i in range(5)]
+
+    index.add_block(make_block(txs[:2]), 1)
+    index.add_block(make_block(txs[2:]), 2)
+
+    assert index.get_location(transaction_id(txs[3])) == (2, 1)
+    assert index.get_history('b', limit=2) == [
+        transaction_id(txs[4]), transaction_id(txs[3])]
+    assert index.get_history('a', limit=None) == [
+        transaction_id(tx) for tx in reversed(txs)]
+    assert index.get_history('nobody') == []
+
+
+def test_repeated_txid_keeps_first_location():
+    index = TransactionIndex()
+    tx = {'sender': 'me'}
+
+    for height in range(1, 4):
+        index.add_block(make_block([tx]), height)
+
+    assert len(index) == 1
+    assert index.get_location(transaction_id(tx)) == (1, 0)
+    assert index.get_history('me') == [transaction_id(tx)]
+
+
+def test_remove_block_drops_locations_and_postings():
+    index = TransactionIndex()
+    old = {'sender': 'a', 'receiver': 'b', 'amount': 1}
+    new = {'sender': 'a', 'receiver': 'c', 'amount': 2}
+
+    index.add_block(make_block([old]), 1)
+    index.add_block(make_block([new]), 2)
+    index.remove_block(make_block([old]), 1)
+
+    assert transaction_id(old) not in index
+    assert index.get_history('a', limit=None) == [transaction_id(new)]
+    assert index.get_history('b', limit=None) == []
+
+
+def test_memory_controller_history_matches_blockchain_contract():
+    controller = MemoryController()
+    txs = [{'sender': 'a', 'amount': i} for i in range(3)]
+
+    controller.save_block(make_block(txs[:2]), 1)
+    controller.save_block(make_block(txs[2:] + txs[:1]), 2)
+
+    history = controller.get_address_history('a', limit=None)
+
+    assert [entry["txid"] for entry in history] == [
+        transaction_id(tx) for tx in reversed(txs)]
+    assert [entry["txid"] for entry in controller.get_address_history('a', 1)] == [
+        transaction_id(txs[2])]
+    assert controller.get_transaction_location(transaction_id(txs[0])) == (1, 0)
+    assert controller.get_transaction_location('missing') is None
+
+
+def test_memory_controller_prunes_old_blocks_to_headers():
+    controller = MemoryController(prune_depth=2)
+    txs = [{'sender': 'a', 'amount': i} for i in range(4)]
+
+    for height, tx in enumerate(txs, 1):
+        controller.save_block(make_block([tx]), height)
+
+    assert [("tx" in controller._blocks[str(height)]) for height in range(1, 5)] == [
+        False, False, True, True]
+    assert controller.get_transaction_location(transaction_id(txs[0])) == (1, 0)
@@ -4,6 +4,32 @@ import threading
 from datetime import date, datetime, timezone
 from contextlib import contextmanager
 
+from tx_index import TransactionIndex
+from transactions import encode_transaction, transaction_id
+
+MAX_SIDE_BLOCKS = 100
+
+
+def merkle_root(transactions):
+    """Returns the merkle root of a transaction list, as built by the miner"""
+    encoded_bytes = b''.join(
+        encode_transaction(transaction) for transaction in transactions)
+
+    return hashlib.sha256(encoded_bytes).hexdigest()
+
+
+def block_hash(block):
+    """Recomputes the proof of work hash of a block from its headers"""
+    headers = [block["index"], block["time"], block["mrkl_root"],
+               block["previous_hash"], str(block["nonce"])]
+
+    return hashlib.sha256(''.join(headers).encode()).hexdigest()
+
+
+def block_header(block):
+    """Returns a block without its transaction list"""
+    return {key: value for key, value in block.items() if key != 'tx'}
+
 
 class Blockchain:
     """The in memory representation of the blockchain.
@@ -26,20 +52,53 @@ class Blockchain:
         controller (:class:`controller.DatabaseController`):
             The datbase controller class which handles all the database
             request throughout the codebase.   
+        prune_depth (int):
+            When set, only the last prune_depth blocks keep their
+            transaction lists. Must be at least 1. Older blocks are reduced to their headers.
+            Spends are checked against the UTXO set, not block bodies.
+        checkpoints (Dict[int, str]):
+            Known block hashes by height. :meth:`is_valid` trusts the
+            history below the highest checkpoint on the chain.
 
     """
 
-    def __init__(self, version, difficulty, arr, controller, lock):
+    def __init__(self, version, difficulty, arr, controller, lock,
+                 prune_depth=None, checkpoints=None):
+        if prune_depth is not None and prune_depth < 1:
+            raise ValueError('prune_depth must be at least 1')
+
         self._chain = []
-        self._transactions = []
+        self._heights = {}
+
+        # Valid blocks off the main chain, by hash. A side branch becomes
+        # the main chain as soon as it is longer.
+        self._side_blocks = {}
+
+        # Pending transactions by txid, in the order they arrived
+        self._transactions = {}
         self._version = version
         self._difficulty = difficulty
         self._controller = controller
         self._lock = lock
+        self._index = TransactionIndex()
+        self._prune_depth = prune_depth
+        self._checkpoints = checkpoints or {}
+
+        # Blocks at or below this height are covered by a checkpoint
+        self._trusted_height = 0
+
+        # Height each txid was first confirmed at. Unlike the index this
+        # survives pruning, so a transaction can never be confirmed twice.
+        self._confirmed = {}
+
+        # Set when a block fails a check is_valid cannot redo later: a
+        # merkle mismatch found while pruning, or a transaction that was
+        # already confirmed
+        self._history_invalid = False
 
         if len(arr) < 1:
             self.genesis_block = self.create_genesis()
-            self._chain.append(self.genesis_block)
+            self._accept_block(self.genesis_block)
         else:
             self.build_from_arr(arr)
 
@@ -76,10 +135,84 @@ class Blockchain:
             arr: A list of blocks to be included in the blockchain
 
         Returns:
-            Nothing: Assigns self.chain to the input list
+            Nothing: Assigns self.chain to the input list and indexes
+            its transactions
 
         """
-        self.chain = arr
+        self._chain = []
+        self._heights = {}
+        self._trusted_height = self._checkpoint_height(arr) or 0
+
+        for block in arr:
+            self._append_block(block)
+
+    def _append_block(self, block):
+        height = len(self._chain)
+
+        for tx in block.get("tx", []):
+            txid = transaction_id(tx)
+
+            if txid not in self._confirmed:
+                self._confirmed[txid] = height
+            elif height > self._trusted_height:
+                self._history_invalid = True
+
+        self._index.add_block(block, height)
+        self._heights[block["hash"]] = height
+        self._chain.append(block)
+
+        if self._prune_depth:
+            self._prune(len(self._chain) - 1 - self._prune_depth)
+
+    def _disconnect_tip(self):
+        """Remove the tip block, undoing :meth:`_append_block`, and return it"""
+        block = self._chain.pop()
+        height = len(self._chain)
+
+        del self._heights[block["hash"]]
+        self._index.remove_block(block, height)
+
+        for tx in block["tx"]:
+            txid = transaction_id(tx)
+
+            if self._confirmed.get(txid) == height:
+                del self._confirmed[txid]
+
+        if self._controller:
+            self._controller.remove_block(block, height)
+
+        return block
+
+    def _accept_block(self, block):
+        """Append a new block, persist it and drop its transactions from the pool
+
+        Blocks loaded by :meth:`build_from_arr` are already stored, so only
+        new blocks go through here.
+        """
+        self._append_block(block)
+        self._remove_from_pool(block)
+
+        if self._controller:
+            self._controller.save_block(block, len(self._chain) - 1)
+
+    def _remove_from_pool(self, block):
+        """Drop the transactions included in a block from the pool"""
+        for tx in block["tx"]:
+            self._transactions.pop(transaction_id(tx), None)
+
+    def _prune(self, height):
+        """Drop the transaction list of the block at the given height"""
+        if height < 0 or "tx" not in self._chain[height]:
+            return
+
+        block = self._chain[height]
+
+        if height > self._trusted_height and \
+                merkle_root(block["tx"]) != block["mrkl_root"]:
+            self._history_invalid = True
+
+        self._index.remove_block(block, height)
+        self._chain[height] = block_header(block)
 
     def print_chain(self):
         for block in self._chain:
@@ -89,15 +222,93 @@ class Blockchain:
                 print(key, value, sep=': ')
 
     def add_transaction(self, transaction):
-        self._transactions.append(transaction)
+        """Add a transaction to the pending pool
 
-    def is_valid(self):
+        Returns:
+            bool: False if the transaction is already pending or on the chain.
+
+        """
+        txid = transaction_id(transaction)
+
+        # Held so a block being accepted cannot race with the pool update
+        with self._lock:
+            if txid in self._transactions or self.has_transaction(txid):
+                return False
 
-        if(len(self.chain) == 1):
+            self._transactions[txid] = transaction
             return True
 
-        idx = 1
-        prev_block = self._chain[0]
+    def has_transaction(self, txid):
+        """Returns whether a transaction is confirmed, even in a pruned block"""
+        return txid in self._confirmed
+
+    def _confirms_new_transactions(self, block):
+        """Returns whether none of a block's transactions is already confirmed"""
+        txids = [transaction_id(tx) for tx in block["tx"]]
+
+        return len(set(txids)) == len(txids) and \
+            not any(self.has_transaction(txid) for txid in txids)
+
+    def get_pending_transaction(self, txid):
+        """Returns a transaction from the pending pool, or None if not pending"""
+        return self._transactions.get(txid)
+
+    def get_pool(self):
+        """Returns a snapshot of the pending transaction pool, by txid"""
+        return dict(self._transactions)
+
+    def get_transactions(self):
+        """Returns a snapshot of the pending transaction pool"""
+        return list(self._transactions.values())
+
+    def get_block(self, block_hash):
+        """Returns the block with the given hash, or None if unknown
+
+        Blocks on side branches are known too.
+        """
+        height = self._heights.get(block_hash)
+
+        if height is None:
+            return self._side_blocks.get(block_hash)
+
+        return self._chain[height]
+
+    def _checkpoint_height(self, blocks):
+        """Returns the height of the highest checkpoint matched by blocks
+
+        Returns None if any checkpoint within blocks does not match.
+        """
+        start = 0
+
+        for height, checkpoint_hash in self._checkpoints.items():
+            if height >= len(blocks):
+                continue
+
+            if blocks[height]["hash"] != checkpoint_hash:
+                return None
+
+            start = max(start, height)
+
+        return start
+
+    def is_valid(self):
+        """Check every block above the highest checkpoint on the chain
+
+        Blocks must link to their predecessor, hash to their headers and
+        meet the difficulty. Transactions must match the merkle root,
+        which is checked before a block is pruned.
+
+        Returns:
+            bool: Whether the chain is valid.
+
+        """
+        start = self._checkpoint_height(self._chain)
+
+        if start is None or self._history_invalid:
+            return False
+
+        idx = start + 1
+        prev_block = self._chain[start]
 
         while idx < len(self._chain):
             curr_block = self._chain[idx]
@@ -105,9 +316,21 @@ class Blockchain:
             if prev_block["hash"] != curr_block["previous_hash"]:
                 return False
 
+            if block_hash(curr_block) != curr_block["hash"]:
+                return False
+
+            if not self.proof_is_valid(curr_block["hash"]):
+                return False
+
+            if "tx" in curr_block and \
+                    merkle_root(curr_block["tx"]) != curr_block["mrkl_root"]:
+                return False
+
             idx = idx + 1
             prev_block = curr_block
 
+        return True
+
     def get_genesis_block(self):
         return self.genesis_block
 
@@ -116,22 +339,169 @@ class Blockchain:
         # By default miners will wait indefinitely to acquire the lock.
         # Change this -1 value to the desired timeout in seconds.
         with self._acquire_with_timeout(-1) as acquired:
-            if acquired and not mined_evt.is_set():
+            if not acquired:
+                print(
+                    f'timeout: lock not available - Miner: {block["relayed_by"]}')
+                return False
 
-                proof = block["hash"]
+            # Another miner got here first
+            if mined_evt.is_set():
+                return False
 
-                if self.proof_is_valid(proof):
-                    self._chain.append(block)
-                    mined_evt.set()
-                    return True
-                else:
-                    print('Proof is invalid')
-                    return False
+            proof = block["hash"]
+
+            if self.proof_is_valid(proof):
+                self._accept_block(block)
+                mined_evt.set()
+                return True
             else:
-                print(
-                    f'timeout: lock not available - Miner: {block["related_by"]}')
+                print('Proof is invalid')
                 return False
 
+    def offer_block(self, block):
+        """Offer a block mined elsewhere, such as one relayed by a peer.
+
+        Unlike :meth:`offer_proof_of_work` the block is not trusted: its
+        hash and merkle root are recomputed and it may not confirm a
+        transaction twice. A block that does not extend the tip is kept
+        on a side branch, and the chain switches to that branch once it
+        is the longest. Transactions of blocks left behind go back to
+        the pending transaction pool.
+
+        Args:
+            block (Dict[str, Any]): The full block, including its tx list.
+
+        Returns:
+            bool: Whether the block is now the tip of the chain.
+
+        """
+        if block_hash(block) != block["hash"]:
+            return False
+
+        if merkle_root(block["tx"]) != block["mrkl_root"]:
+            return False
+
+        if not self.proof_is_valid(block["hash"]):
+            return False
+
+        with self._acquire_with_timeout(-1) as acquired:
+            if not acquired or self.get_block(block["hash"]) is not None:
+                return False
+
+            if block["previous_hash"] != self._chain[-1]["hash"]:
+                return self._offer_side_block(block)
+
+            if not self._confirms_new_transactions(block):
+                return False
+
+            self._accept_block(block)
+
+            return True
+
+    def _offer_side_block(self, block):
+        """Keep a block off the tip and switch to its branch if it is longer"""
+        branch = [block]
+        parent_hash = block["previous_hash"]
+
+        while parent_hash not in self._heights:
+            parent = self._side_blocks.get(parent_hash)
+
+            if parent is None:
+                return False
+
+            branch.append(parent)
+            parent_hash = parent["previous_hash"]
+
+        if len(self._side_blocks) >= MAX_SIDE_BLOCKS:
+            return False
+
+        self._side_blocks[block["hash"]] = block
+
+        branch.reverse()
+        fork_height = self._heights[parent_hash]
+
+        # Ties keep the branch seen first
+        if fork_height + len(branch) <= len(self._chain) - 1:
+            return False
+
+        return self._reorganize(fork_height, branch)
+
+    def _reorganize(self, fork_height, branch):
+        """Replace the blocks above fork_height with a longer branch"""
+        checkpoint_height = self._checkpoint_height(self._chain)
+
+        if checkpoint_height is not None and fork_height < checkpoint_height:
+            return False
+
+        disconnected = self._chain[fork_height + 1:]
+
+        # Blocks below the prune depth no longer have the bodies to undo
+        if any("tx" not in old for old in disconnected):
+            return False
+
+        seen = set()
+
+        for new in branch:
+            for tx in new["tx"]:
+                txid = transaction_id(tx)
+                confirmed_height = self._confirmed.get(txid)
+
+                if txid in seen or \
+                        (confirmed_height is not None and confirmed_height <= fork_height):
+                    return False
+
+                seen.add(txid)
+
+        while len(self._chain) - 1 > fork_height:
+            old = self._disconnect_tip()
+            self._side_blocks[old["hash"]] = old
+
+        for new in branch:
+            del self._side_blocks[new["hash"]]
+            self._accept_block(new)
+
+        for old in disconnected:
+            for tx in old["tx"]:
+                txid = transaction_id(tx)
+
+                if txid not in self._confirmed:
+                    self._transactions[txid] = tx
+
+        return True
+
+    def get_transaction(self, txid):
+        """Returns a transaction included in the chain, or None if unknown or pruned"""
+        location = self._index.get_location(txid)
+
+        if location is None:
+            return None
+
+        height, position = location
+        block = self._chain[height]
+
+        if "tx" not in block:
+            # Pruned: only the header is kept for this block
+            return None
+
+        return block["tx"][position]
+
+    def get_address_history(self, address, limit=20):
+        """Returns the latest transactions involving an address, newest first
+
+        Transactions in pruned blocks are no longer indexed.
+
+        Args:
+            address (str): The wallet address to look up.
+            limit (int): Maximum number of transactions returned. None
+                returns the full history.
+
+        Returns:
+            list[Dict[str, Any]]: The matching transactions.
+
+        """
+        return [self.get_transaction(txid)
+                for txid in self._index.get_history(address, limit)]
+
     def proof_is_valid(self, proof):
         return proof[:self._difficulty] == ''.zfill(self._difficulty)
 
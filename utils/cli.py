@@ -0,0 +1,221 @@
+"""
+Contains the discoin command line interface.
+
+Every subcommand imports only the modules it needs, so commands that
+never talk to Firestore never pay for loading firebase_admin.
+
+Usage:
+    python cli.py mine --blocks 20
+    python cli.py validate --credentials <path> [--checkpoint HEIGHT:HASH]
+    python cli.py bench --blocks 10 --miners 4
+    python cli.py simulate --wallets 1000 --blocks 20
+    python cli.py wallet new <name> [--register --credentials <path>]
+    python cli.py wallet show <user> --credentials <path>
+
+"""
+
+
+import argparse
+import sys
+
+CREDENTIALS_PATH = 'discoin-ae632-firebase-adminsdk-olger-6d18986a1e.json'
+
+
+def _local_blockchain(difficulty, prune_depth=None):
+    import threading
+    from blockchain import Blockchain
+
+    return Blockchain(1, difficulty, [], None, threading.Lock(),
+                      prune_depth=prune_depth)
+
+
+def _positive_int(value):
+    """Parses an integer argument that must be at least 1"""
+    if not value.isdigit() or int(value) < 1:
+        raise argparse.ArgumentTypeError('must be a positive integer')
+
+    return int(value)
+
+
+def _checkpoint(value):
+    """Parses a HEIGHT:HASH checkpoint argument"""
+    height, _, block_hash = value.partition(':')
+
+    if not height.isdigit() or not block_hash:
+        raise argparse.ArgumentTypeError('checkpoints look like HEIGHT:HASH')
+
+    return int(height), block_hash
+
+
+def _mine(_blockchain, n_blocks, n_miners, difficulty):
+    from miner import mine_block
+
+    version = {'id': 1, 'difficulty': difficulty}
+    addresses = [str(i) for i in range(1, n_miners + 1)]
+
+    # Every block needs its own transaction, one can only be confirmed once
+    for i in range(n_blocks):
+        mine_block(_blockchain, addresses, version, [{'sender': 'me', 'n': i}])
+
+
+def mine(args):
+    """Mines blocks onto a fresh in memory blockchain"""
+    chain = _local_blockchain(args.difficulty, args.prune_depth)
+
+    _mine(chain, args.blocks, args.miners, args.difficulty)
+
+    for block in chain:
+        print(block["index"], block["hash"], sep=': ')
+
+    print('Valid' if chain.is_valid() else 'Invalid')
+
+
+def validate(args):
+    """Validates the blockchain stored in Firestore"""
+    import threading
+    from blockchain import Blockchain
+    from controller import DatabaseController
+
+    controller = DatabaseController(args.credentials)
+
+    version = controller.get_blockchain_version()
+    blocks = [block.to_dict() for block in controller.get_blockchain_stream()]
+
+    # Miners store the index as a string, so Firestore orders it
+    # lexicographically ('1', '10', '2', ...)
+    blocks.sort(key=lambda block: int(block["index"]))
+
+    chain = Blockchain(version["version_id"], version["difficulty"],
+                       blocks, controller, threading.Lock(),
+                       prune_depth=args.prune_depth,
+                       checkpoints=dict(args.checkpoint))
+
+    if chain.is_valid():
+        print(f'Valid: {len(blocks)} blocks')
+        return 0
+
+    print('Invalid blockchain')
+    return 1
+
+
+def bench(args):
+    """Times mining blocks onto a fresh in memory blockchain"""
+    import time
+
+    chain = _local_blockchain(args.difficulty)
+
+    start = time.perf_counter()
+    _mine(chain, args.blocks, args.miners, args.difficulty)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f'Mined {args.blocks} blocks with {args.miners} miners '
+        f'at difficulty {args.difficulty}\n'
+        f'Elapsed: {elapsed:.3f}s\n'
+        f'Blocks/s: {args.blocks / elapsed:.2f}'
+    )
+
+
+def simulate(args):
+    """Measures end to end throughput against an in memory backend"""
+    from simulator import Simulator, print_report
+
+    simulator = Simulator(
+        n_wallets=args.wallets,
+        n_miners=args.miners,
+        difficulty=args.difficulty,
+        block_size=args.block_size,
+        tx_rate=args.tx_rate,
+        prune_depth=args.prune_depth,
+        seed=args.seed,
+    )
+
+    print_report(simulator.run(args.blocks))
+
+
+def wallet(args):
+    """Creates or shows a wallet"""
+    from factories import WalletFactory
+
+    controller = None
+    if args.action == 'show' or args.register:
+        from controller import DatabaseController
+        controller = DatabaseController(args.credentials)
+
+    if args.action == 'new':
+        new_wallet = WalletFactory().create_wallet(controller, name=args.name)
+
+        if args.register:
+            controller.register_new_user(new_wallet)
+
+        new_wallet.print_wallet()
+        return 0
+
+    address = controller.get_user_address(args.name)
+    wallet_dict = controller.get_user_wallet(address)
+    user_wallet = WalletFactory().create_wallet(
+        controller, wallet_dict=wallet_dict)
+
+    user_wallet.print_wallet()
+    print(f'Amount: {user_wallet.amount}')
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='discoin')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_mining_args(subparser, blocks, miners, difficulty):
+        subparser.add_argument('--blocks', type=int, default=blocks)
+        subparser.add_argument('--miners', type=int, default=miners)
+        subparser.add_argument('--difficulty', type=int, default=difficulty)
+
+    mine_parser = subparsers.add_parser('mine', help=mine.__doc__)
+    add_mining_args(mine_parser, 20, 6, 4)
+    mine_parser.add_argument('--prune-depth', type=_positive_int,
+                             help='keep transactions for the last N blocks only')
+    mine_parser.set_defaults(func=mine)
+
+    validate_parser = subparsers.add_parser('validate', help=validate.__doc__)
+    validate_parser.add_argument('--credentials', default=CREDENTIALS_PATH)
+    validate_parser.add_argument('--prune-depth', type=_positive_int,
+                                 help='keep transactions for the last N blocks only')
+    validate_parser.add_argument('--checkpoint', type=_checkpoint, action='append',
+                                 default=[], metavar='HEIGHT:HASH',
+                                 help='trust the chain up to this block')
+    validate_parser.set_defaults(func=validate)
+
+    bench_parser = subparsers.add_parser('bench', help=bench.__doc__)
+    add_mining_args(bench_parser, 10, 4, 3)
+    bench_parser.set_defaults(func=bench)
+
+    simulate_parser = subparsers.add_parser('simulate', help=simulate.__doc__)
+    add_mining_args(simulate_parser, 20, 4, 4)
+    simulate_parser.add_argument('--wallets', type=int, default=1000)
+    simulate_parser.add_argument('--block-size', type=int, default=500)
+    simulate_parser.add_argument('--tx-rate', type=float,
+                                 help='transactions per second, unlimited by default')
+    simulate_parser.add_argument('--prune-depth', type=_positive_int,
+                                 help='keep transactions for the last N blocks only')
+    simulate_parser.add_argument('--seed', type=int)
+    simulate_parser.set_defaults(func=simulate)
+
+    wallet_parser = subparsers.add_parser('wallet', help=wallet.__doc__)
+    wallet_parser.add_argument('action', choices=['new', 'show'])
+    wallet_parser.add_argument('name', help='wallet owner or username')
+    wallet_parser.add_argument('--register', action='store_true',
+                               help='save a new wallet to Firestore')
+    wallet_parser.add_argument('--credentials', default=CREDENTIALS_PATH)
+    wallet_parser.set_defaults(func=wallet)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    return args.func(args) or 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
-import firebase_admin
-from firebase_admin import firestore
-import factories
+import threading
+from itertools import islice
+
+from blockchain import block_header
+from tx_index import TransactionIndex
 
 
 class UserDoesNotExist(Exception):
@@ -20,15 +22,21 @@ class WalletDoesNotExist(Exception):
 class DatabaseController:
 
     def __init__(self, credentials_path):
-        self.credentials = firebase_admin.credentials.Certificate(
-            credentials_path)
+        # firebase_admin pulls in the whole google cloud stack, so it is
+        # only imported once a controller is actually needed.
+        from firebase_admin import credentials
+
+        self.credentials = credentials.Certificate(credentials_path)
         self._start_firebase_app()
 
     def _start_firebase_app(self):
         """Creates a firestore client instance"""
+        import firebase_admin
+        from firebase_admin import firestore
 
         firebase_admin.initialize_app(self.credentials)
         self.db = firestore.client()
+        self._query = firestore.Query
 
     def get_user_address(self, username: str):
         """
@@ -64,7 +72,7 @@ class DatabaseController:
         blocks_ref = self.db.collection('blocks')
 
         query = blocks_ref.order_by(
-            'index', direction=firestore.Query.ASCENDING
+            'index', direction=self._query.ASCENDING
         )
 
         return query.stream()
@@ -73,7 +81,7 @@ class DatabaseController:
         versions_ref = self.db.collection('versions')
 
         query = versions_ref.order_by(
-            'version_id', direction=firestore.Query.DESCENDING
+            'version_id', direction=self._query.DESCENDING
         ).limit(1)
 
         [version_res] = [v for v in query.stream()]
@@ -81,7 +89,78 @@ class DatabaseController:
         return version_res.to_dict()
 
     def save_block(self, block, index):
-        self.db.collection('blocks').document(str(index)).set(block)
+        """
+        Saves a block together with its transaction index entries, so
+        history and receipt lookups never have to stream the blocks.
+        """
+        entries = TransactionIndex.block_entries(block, int(index))
+        tx_refs = [self.db.collection('transactions').document(entry["txid"])
+                   for entry in entries]
+
+        # A txid already on the chain keeps its first location
+        indexed = {doc.id for doc in self.db.get_all(tx_refs) if doc.exists}
+
+        batch = self.db.batch()
+
+        batch.set(self.db.collection('blocks').document(str(index)), block)
+
+        for tx_ref, entry in zip(tx_refs, entries):
+            if entry["txid"] not in indexed:
+                batch.set(tx_ref, entry)
+
+        batch.commit()
+
+    def remove_block(self, block, index):
+        """
+        Deletes the index entries of a block dropped by a chain
+        reorganization. The block document itself is overwritten by the
+        block that replaces it.
+        """
+
+        entries = TransactionIndex.block_entries(block, int(index))
+        tx_refs = [self.db.collection('transactions').document(entry["txid"])
+                   for entry in entries]
+
+        batch = self.db.batch()
+
+        for doc in self.db.get_all(tx_refs):
+            if doc.exists and doc.to_dict()["height"] == int(index):
+                batch.delete(doc.reference)
+
+        batch.commit()
+
+    def get_transaction_location(self, txid):
+        """
+        Returns the (height, position) of a saved transaction,
+        or None if it has not been included in a saved block.
+        """
+
+        tx_doc = self.db.collection('transactions').document(txid).get()
+
+        if not tx_doc.exists:
+            return None
+
+        entry = tx_doc.to_dict()
+        return entry["height"], entry["position"]
+
+    def get_address_history(self, addr, limit=20):
+        """
+        Returns the latest index entries involving an address, newest first.
+        A limit of None returns the full history.
+        """
+
+        query = self.db.collection('transactions').where(
+            'addresses', 'array_contains', addr
+        ).order_by(
+            'height', direction=self._query.DESCENDING
+        ).order_by(
+            'position', direction=self._query.DESCENDING
+        )
+
+        if limit is not None:
+            query = query.limit(limit)
+
+        return [entry.to_dict() for entry in query.stream()]
 
     def save_wallet(self, wallet, address):
         self.db.collection('wallets').document(address).set(wallet.to_dict())
@@ -113,3 +192,143 @@ class DatabaseController:
         utxo_query = utxo_ref.where('rec_addr', '==', addr)
 
         return [utxo.to_dict() for utxo in utxo_query.stream()]
+
+
+class MemoryController:
+
+    """In memory stand-in for :class:`DatabaseController`
+
+    Keeps users, wallets, blocks and UTXOs in dictionaries so simulations
+    and benchmarks can run without Firestore. Safe to share between
+    threads.
+
+    Args:
+        prune_depth (int):
+            Keep transaction lists for the last prune_depth saved blocks
+            only, older blocks are stored as headers. The transaction
+            index is kept in full. None keeps every block.
+    """
+
+    def __init__(self, prune_depth=None):
+        if prune_depth is not None and prune_depth < 1:
+            raise ValueError('prune_depth must be at least 1')
+
+        self._prune_depth = prune_depth
+        self._lock = threading.Lock()
+        self._users = {}
+        self._wallets = {}
+        self._public_keys = {}
+        self._blocks = {}
+        self._transactions = {}
+        self._history = {}
+        self._utxos = {}
+
+    def get_user_address(self, username: str):
+        """
+        Returns the user's wallet address if it exists.
+        If not, raises UserDoesNotExist exception.
+        """
+
+        if username not in self._users:
+            raise UserDoesNotExist
+
+        return self._users[username]
+
+    def get_user_wallet(self, address):
+        """
+        Returns user wallet matching the given address if it exists.
+        If it does not exist, raises WalletDoesNotExist exception.
+        """
+
+        if address not in self._wallets:
+            raise WalletDoesNotExist
+
+        return self._wallets[address]
+
+    def save_block(self, block, index):
+        with self._lock:
+            self._blocks[str(index)] = block
+
+            for entry in TransactionIndex.block_entries(block, int(index)):
+                if entry["txid"] in self._transactions:
+                    continue
+
+                self._transactions[entry["txid"]] = entry
+
+                for address in entry["addresses"]:
+                    self._history.setdefault(address, []).append(entry)
+
+            if self._prune_depth:
+                pruned = str(int(index) - self._prune_depth)
+
+                if pruned in self._blocks:
+                    self._blocks[pruned] = block_header(self._blocks[pruned])
+
+    def remove_block(self, block, index):
+        """Deletes the index entries of a block dropped by a reorganization"""
+
+        with self._lock:
+            self._blocks.pop(str(index), None)
+
+            for entry in TransactionIndex.block_entries(block, int(index)):
+                saved = self._transactions.get(entry["txid"])
+
+                if saved is None or saved["height"] != int(index):
+                    continue
+
+                del self._transactions[entry["txid"]]
+
+                for address in saved["addresses"]:
+                    self._history[address].remove(saved)
+
+    def get_transaction_location(self, txid):
+        """
+        Returns the (height, position) of a saved transaction,
+        or None if it has not been included in a saved block.
+        """
+
+        entry = self._transactions.get(txid)
+
+        if entry is None:
+            return None
+
+        return entry["height"], entry["position"]
+
+    def get_address_history(self, addr, limit=20):
+        """
+        Returns the latest index entries involving an address, newest first.
+        A limit of None returns the full history.
+        """
+
+        with self._lock:
+            entries = self._history.get(addr, [])
+            return list(islice(reversed(entries), limit))
+
+    def register_new_user(self, wallet):
+        with self._lock:
+            self._public_keys[wallet.address] = wallet.public_key
+            self._wallets[wallet.address] = wallet.to_dict()
+            self._users[wallet.owner] = wallet.address
+
+    def add_utxo(self, amount, rec_addr):
+        with self._lock:
+            self._utxos.setdefault(rec_addr, []).append({
+                'rec_addr': rec_addr,
+                'amount': amount
+            })
+
+    def remove_utxo(self, utxo):
+        """Removes a spent UTXO. Returns whether it was unspent."""
+
+        with self._lock:
+            utxo_list = self._utxos.get(utxo["rec_addr"], [])
+
+            if utxo not in utxo_list:
+                return False
+
+            utxo_list.remove(utxo)
+            return True
+
+    def get_utxo_list(self, addr):
+        with self._lock:
+            return list(self._utxos.get(addr, []))
@@ -2,7 +2,6 @@ import hashlib
 import binascii
 import wallets
 import base64
-import ecdsa
 
 NO_PARAMS = "Wallet factory requires either a name or a wallet dictionary."
 
@@ -31,6 +30,8 @@ class WalletFactory:
     # Generates ECDSA key pair
 
     def generate_key_pair(self):
+        import ecdsa
+
         sk = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
         private_key = sk.to_string().hex()
 
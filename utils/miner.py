@@ -1,6 +1,5 @@
 import threading
 import hashlib
-import json
 import sys
 from datetime import datetime, timezone
 from random import randint
@@ -42,15 +41,7 @@ class Miner:
 
     @staticmethod
     def create_merkle_root(transactions):
-        def encode(transaction):
-            return json.dumps(
-                transaction, sort_keys=True).encode()
-
-        encoded_list = [encode(transaction) for transaction in transactions]
-
-        encoded_bytes = b''.join(encoded_list)
-
-        return hashlib.sha256(encoded_bytes).hexdigest()
+        return blockchain.merkle_root(transactions)
 
     def run(self, time, txs):
         prev_block = self._blockchain.get_last_block()
@@ -108,15 +99,26 @@ class Miner:
         self._t.join()
 
 
-lock = threading.Lock()
-blockchain = blockchain.Blockchain(1, 4, [], None, lock)
-
-
-def mine_block():
+def mine_block(_blockchain, addresses, version, txs):
+    """Start a miner for every address and wait until one mines the block"""
     mined_evt = threading.Event()
 
     time_now = datetime.now(timezone.utc).strftime("%d-%b-%Y (%H:%M:%S.%f)")
 
+    miners = [Miner(public_address, version, _blockchain, mined_evt)
+              for public_address in addresses]
+
+    for miner in miners:
+        miner.start(time_now, txs)
+
+    for miner in miners:
+        miner.join()
+
+
+if __name__ == '__main__':
+    lock = threading.Lock()
+    chain = blockchain.Blockchain(1, 4, [], None, lock)
+
     wallets = [
         '1',
         '2',
@@ -126,25 +128,14 @@ def mine_block():
         '9'
     ]
 
-    miners = []
-
-    for public_address in wallets:
-        version = {
-            'id': 1,
-            'difficulty': 4
-        }
-        miners.append(Miner(public_address, version, blockchain, mined_evt))
-
-    for miner in miners:
-        miner.start(time_now, [{'sender': 'me'}])
-
-    for miner in miners:
-        miner.join()
-
+    version = {
+        'id': 1,
+        'difficulty': 4
+    }
 
-for i in range(20):
-    mine_block()
+    for i in range(20):
+        mine_block(chain, wallets, version, [{'sender': 'me'}])
 
-# blockchain.print_chain()
-for block in blockchain:
-    print(block["index"])
+    # chain.print_chain()
+    for block in chain:
+        print(block["index"])
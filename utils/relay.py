@@ -0,0 +1,428 @@
+"""
+Contains the definition of the Node class, which relays blocks and
+transactions between DisCoin nodes over TCP.
+
+Messages are newline delimited JSON objects with a "type" key. New
+blocks and transactions are announced by hash only (inv) and peers
+request what they are missing (getdata). Blocks are sent in compact
+form: the headers plus a short id for every transaction. The receiver
+rebuilds the block from its own transaction pool and only requests the
+transactions it has never seen (getblocktxn / blocktxn).
+
+"""
+
+
+import asyncio
+import json
+
+from blockchain import block_header, transaction_id
+
+SHORT_ID_LENGTH = 12
+
+MAX_ORPHANS = 100
+
+MAX_PENDING = 100
+
+# Longest message line accepted from a peer. Full blocks of wallet
+# transactions are well past asyncio's 64 KiB default.
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+
+# Raised by handlers reading a malformed message from a peer
+MALFORMED_MESSAGE_ERRORS = (
+    KeyError, IndexError, TypeError, ValueError, AttributeError)
+
+
+def short_id(txid):
+    """Returns the short transaction id used in compact blocks"""
+    return txid[:SHORT_ID_LENGTH]
+
+
+def encode_message(message):
+    """Returns a message encoded for the wire"""
+    return json.dumps(message, default=lambda value: value.decode()).encode() + b'\n'
+
+
+class Peer:
+
+    """A connection to a remote node
+
+    Args:
+        reader (:class:`asyncio.StreamReader`):
+            Stream the peer's messages are read from.
+        writer (:class:`asyncio.StreamWriter`):
+            Stream messages to the peer are written to.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.address = writer.get_extra_info('peername')
+
+    async def send(self, message):
+        self.writer.write(encode_message(message))
+        await self.writer.drain()
+
+    async def receive(self):
+        """Returns the next message, or None once the peer disconnects
+
+        Raises ValueError for a line that is too long or not JSON.
+        """
+        line = await self.reader.readline()
+
+        if not line:
+            return None
+
+        return json.loads(line)
+
+    async def close(self):
+        self.writer.close()
+
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+class Node:
+
+    """A DisCoin node relaying blocks and transactions to its peers
+
+    Accepted blocks are handed to :meth:`blockchain.Blockchain.offer_block`
+    and accepted transactions to the blockchain's transaction pool, which
+    doubles as the pool compact blocks are rebuilt from.
+
+    Args:
+        _blockchain (:class:`blockchain.Blockchain`):
+            The local chain blocks and transactions are relayed for.
+        host (str):
+            Interface the node listens on.
+        port (int):
+            Port the node listens on. 0 picks a free port.
+    """
+
+    def __init__(self, _blockchain, host='127.0.0.1', port=0):
+        self._blockchain = _blockchain
+        self.host = host
+        self.port = port
+        self._server = None
+        self._peers = []
+        self._tasks = set()
+
+        # Blocks asked for with getdata whose compact block has not arrived
+        self._requested = set()
+
+        # Compact blocks waiting on transactions from the sender, by hash
+        self._pending = {}
+
+        # Blocks whose parent is not in the chain yet, by previous hash
+        self._orphans = {}
+
+        self._handlers = {
+            'inv': self._on_inv,
+            'getdata': self._on_getdata,
+            'tx': self._on_tx,
+            'cmpctblock': self._on_cmpctblock,
+            'getblocktxn': self._on_getblocktxn,
+            'blocktxn': self._on_blocktxn,
+        }
+
+    async def start(self):
+        """Starts listening for peers"""
+        self._server = await asyncio.start_server(
+            self._on_connection, self.host, self.port, limit=MAX_MESSAGE_SIZE)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Disconnects every peer and stops listening"""
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+        for peer in list(self._peers):
+            await peer.close()
+
+        for task in list(self._tasks):
+            task.cancel()
+
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def connect(self, host, port):
+        """Opens a connection to another node"""
+        reader, writer = await asyncio.open_connection(
+            host, port, limit=MAX_MESSAGE_SIZE)
+        self._add_peer(Peer(reader, writer))
+
+    async def announce_block(self, block, exclude=None):
+        """Announces a block appended to the local chain to every peer"""
+        await self._broadcast(
+            {'type': 'inv', 'blocks': [block["hash"]], 'txs': []}, exclude)
+
+    async def announce_transaction(self, transaction, exclude=None):
+        """Announces a transaction in the local pool to every peer"""
+        await self._broadcast(
+            {'type': 'inv', 'blocks': [], 'txs': [transaction_id(transaction)]},
+            exclude)
+
+    async def submit_transaction(self, transaction):
+        """Adds a local transaction to the pool and relays it"""
+        if self._add_transaction(transaction):
+            await self.announce_transaction(transaction)
+
+    def _add_peer(self, peer):
+        self._peers.append(peer)
+
+        task = asyncio.ensure_future(self._serve(peer))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _on_connection(self, reader, writer):
+        self._add_peer(Peer(reader, writer))
+
+    async def _serve(self, peer):
+        try:
+            # Let a new peer know about our tip so it can catch up
+            await peer.send({
+                'type': 'inv',
+                'blocks': [self._blockchain.get_last_block()["hash"]],
+                'txs': [],
+            })
+
+            while True:
+                try:
+                    message = await peer.receive()
+                except ValueError:
+                    # Oversized or not JSON: skip the line, keep the peer
+                    continue
+
+                if message is None:
+                    break
+
+                if not isinstance(message, dict):
+                    continue
+
+                handler = self._handlers.get(message.get('type'))
+
+                if handler is None:
+                    continue
+
+                try:
+                    await handler(peer, message)
+                except MALFORMED_MESSAGE_ERRORS:
+                    # Drop the message, not the connection
+                    continue
+        except ConnectionError:
+            pass
+        finally:
+            if peer in self._peers:
+                self._peers.remove(peer)
+            await peer.close()
+
+    async def _broadcast(self, message, exclude=None):
+        for peer in list(self._peers):
+            if peer is exclude:
+                continue
+
+            try:
+                await peer.send(message)
+            except ConnectionError:
+                pass
+
+    def _add_transaction(self, transaction):
+        return self._blockchain.add_transaction(transaction)
+
+    def _knows_transaction(self, txid):
+        return self._blockchain.get_pending_transaction(txid) is not None \
+            or self._blockchain.has_transaction(txid)
+
+    async def _on_inv(self, peer, message):
+        blocks = [block_hash for block_hash in message.get('blocks', [])
+                  if self._blockchain.get_block(block_hash) is None
+                  and block_hash not in self._pending
+                  and block_hash not in self._requested]
+        txs = [txid for txid in message.get('txs', [])
+               if not self._knows_transaction(txid)]
+
+        if blocks or txs:
+            # Forget unanswered requests rather than grow without bound
+            if len(self._requested) >= MAX_PENDING:
+                self._requested.clear()
+
+            self._requested.update(blocks)
+            await peer.send({'type': 'getdata', 'blocks': blocks, 'txs': txs})
+
+    async def _on_getdata(self, peer, message):
+        for txid in message.get('txs', []):
+            transaction = self._blockchain.get_pending_transaction(txid)
+
+            if transaction is not None:
+                await peer.send({'type': 'tx', 'tx': transaction})
+
+        for block_hash in message.get('blocks', []):
+            block = self._blockchain.get_block(block_hash)
+
+            # Pruned blocks can no longer be served
+            if block is None or "tx" not in block:
+                continue
+
+            await peer.send({
+                'type': 'cmpctblock',
+                'header': block_header(block),
+                'short_ids': [short_id(transaction_id(tx)) for tx in block["tx"]],
+            })
+
+    async def _on_tx(self, peer, message):
+        transaction = message['tx']
+
+        if self._add_transaction(transaction):
+            await self.announce_transaction(transaction, exclude=peer)
+
+    async def _on_cmpctblock(self, peer, message):
+        header = message['header']
+        short_ids = message['short_ids']
+
+        self._requested.discard(header["hash"])
+
+        if self._blockchain.get_block(header["hash"]) is not None \
+                or header["hash"] in self._pending:
+            return
+
+        by_short_id = {
+            short_id(txid): tx for txid, tx in self._blockchain.get_pool().items()
+        }
+        txs = [by_short_id.get(sid) for sid in short_ids]
+        missing = [i for i, tx in enumerate(txs) if tx is None]
+
+        if missing:
+            if len(self._pending) >= MAX_PENDING:
+                return
+
+            self._pending[header["hash"]] = (header, txs)
+            await peer.send({
+                'type': 'getblocktxn',
+                'hash': header["hash"],
+                'indexes': missing,
+            })
+            return
+
+        await self._receive_block(peer, dict(header, tx=txs))
+
+    async def _on_getblocktxn(self, peer, message):
+        block = self._blockchain.get_block(message['hash'])
+
+        if block is None or "tx" not in block:
+            return
+
+        indexes = message['indexes']
+        n_tx = len(block["tx"])
+
+        if not all(isinstance(i, int) and 0 <= i < n_tx for i in indexes):
+            return
+
+        await peer.send({
+            'type': 'blocktxn',
+            'hash': message['hash'],
+            'txs': [block["tx"][i] for i in indexes],
+        })
+
+    async def _on_blocktxn(self, peer, message):
+        pending = self._pending.pop(message['hash'], None)
+
+        if pending is None:
+            return
+
+        header, txs = pending
+        missing = [i for i, tx in enumerate(txs) if tx is None]
+
+        if len(message['txs']) != len(missing):
+            return
+
+        for i, tx in zip(missing, message['txs']):
+            txs[i] = tx
+
+        await self._receive_block(peer, dict(header, tx=txs))
+
+    async def _receive_block(self, peer, block):
+        """Offers a rebuilt block to the chain, then any orphans it unlocks"""
+        if self._blockchain.get_block(block["previous_hash"]) is None:
+            # We are behind: hold on to the block and ask for its parent
+            if len(self._orphans) < MAX_ORPHANS:
+                self._orphans[block["previous_hash"]] = block
+            await peer.send({
+                'type': 'getdata',
+                'blocks': [block["previous_hash"]],
+                'txs': [],
+            })
+            return
+
+        while block is not None:
+            if self._blockchain.offer_block(block):
+                await self.announce_block(block, exclude=peer)
+            elif self._blockchain.get_block(block["hash"]) is None:
+                # Rejected, so any orphan waiting on it is invalid too
+                break
+
+            # Accepted as the tip or onto a side branch
+            block = self._orphans.pop(block["hash"], None)
+
+
+if __name__ == '__main__':
+    import threading
+    from datetime import datetime, timezone
+
+    from blockchain import Blockchain, block_hash, merkle_root
+
+    DIFFICULTY = 2
+
+    def mine(_blockchain, txs):
+        prev_block = _blockchain.get_last_block()
+
+        block = {
+            'index': str(int(prev_block["index"]) + 1),
+            'ver': 1,
+            'time': datetime.now(timezone.utc).strftime("%d-%b-%Y (%H:%M:%S.%f)"),
+            'tx': txs,
+            'n_tx': len(txs),
+            'mrkl_root': merkle_root(txs),
+            'previous_hash': prev_block["hash"],
+        }
+
+        nonce = 0
+        while True:
+            block["nonce"] = str(nonce)
+            block["hash"] = block_hash(block)
+
+            if _blockchain.proof_is_valid(block["hash"]):
+                return block
+
+            nonce = nonce + 1
+
+    async def demo():
+        chains = [Blockchain(1, DIFFICULTY, [], None, threading.Lock())
+                  for _ in range(3)]
+        nodes = [Node(chain) for chain in chains]
+
+        for node in nodes:
+            await node.start()
+
+        # a <-> b <-> c, so c only hears from a through b
+        await nodes[1].connect(nodes[0].host, nodes[0].port)
+        await nodes[2].connect(nodes[1].host, nodes[1].port)
+
+        shared_tx = {'sender': 'a', 'receiver': 'b', 'amount': 1}
+        await nodes[0].submit_transaction(shared_tx)
+        await asyncio.sleep(0.2)
+
+        # c has to fetch this one while reconstructing the block
+        private_tx = {'sender': 'a', 'receiver': 'c', 'amount': 2}
+        block = mine(chains[0], [shared_tx, private_tx])
+        chains[0].offer_block(block)
+        await nodes[0].announce_block(block)
+        await asyncio.sleep(0.2)
+
+        for name, chain in zip('abc', chains):
+            print(name, [b["index"] for b in chain], chain.get_transactions())
+
+        for node in nodes:
+            await node.stop()
+
+    asyncio.run(demo())
@@ -0,0 +1,277 @@
+"""
+Contains the definition of the Simulator class, an end to end load
+generator for DisCoin.
+
+Wallets are created through the WalletFactory and funded with the
+factory's starting amount. A traffic thread sends transfers between
+random wallets using Wallet.create_transaction while the calling thread
+mines blocks out of the transaction pool with competing miners. Every
+backend is in memory, so the numbers reflect the code, not Firestore.
+
+"""
+
+
+import random
+import statistics
+import sys
+import threading
+import time
+from collections import namedtuple
+
+import blockchain
+from controller import MemoryController
+from factories import WalletFactory
+from miner import mine_block
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SimulationReport = namedtuple('SimulationReport', [
+    'wallets',
+    'miners',
+    'blocks',
+    'transactions',
+    'elapsed',
+    'tx_per_sec',
+    'latency_p50',
+    'latency_p90',
+    'latency_p99',
+    'orphan_rate',
+    'peak_memory_kb',
+])
+
+
+class _SimulatedBlockchain(blockchain.Blockchain):
+
+    """Blockchain that counts proofs arriving after the block was mined
+
+    Those proofs are the in process equivalent of orphaned blocks: valid
+    work that lost the race to another miner.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.orphans = 0
+        self._orphans_lock = threading.Lock()
+
+    def offer_proof_of_work(self, block, mined_evt):
+        accepted = super().offer_proof_of_work(block, mined_evt)
+
+        if not accepted:
+            with self._orphans_lock:
+                self.orphans = self.orphans + 1
+
+        return accepted
+
+
+class Simulator:
+
+    """Drives transfer traffic and mining against an in memory backend
+
+    Args:
+        n_wallets (int):
+            Number of wallets created and funded before the run.
+        n_miners (int):
+            Number of miners competing for every block.
+        difficulty (int):
+            Number of leading 0's required in block hashes.
+        block_size (int):
+            Maximum number of transactions mined into one block.
+        tx_rate (float):
+            Target transactions per second sent by the traffic thread.
+            None sends as fast as wallets can sign.
+        prune_depth (int):
+            Passed through to :class:`blockchain.Blockchain` and the
+            :class:`controller.MemoryController`.
+        seed (int):
+            Seed for the traffic's random choices.
+    """
+
+    def __init__(self, n_wallets=1000, n_miners=4, difficulty=3, block_size=500,
+                 tx_rate=None, prune_depth=None, seed=None):
+        self._n_miners = n_miners
+        self._version = {'id': 1, 'difficulty': difficulty}
+        self._block_size = block_size
+        self._tx_rate = tx_rate
+        self._random = random.Random(seed)
+
+        self.controller = MemoryController(prune_depth=prune_depth)
+        self.blockchain = _SimulatedBlockchain(
+            1, difficulty, [], self.controller, threading.Lock(),
+            prune_depth=prune_depth)
+
+        self.wallets = self._create_wallets(n_wallets)
+        self._addresses = list(self.wallets)
+
+        # Wallets without a pending transaction. A wallet stays out of
+        # this list until its transaction is mined, so it never spends
+        # the same UTXO twice.
+        self._idle = list(self.wallets)
+        self._idle_lock = threading.Lock()
+
+        # Submission time of every pending transaction, by txid
+        self._submitted = {}
+        self._latencies = []
+        self._stop_evt = threading.Event()
+
+    def _create_wallets(self, n_wallets):
+        factory = WalletFactory()
+        wallets = {}
+
+        for i in range(n_wallets):
+            wallet = factory.create_wallet(self.controller, name=f'wallet-{i}')
+
+            self.controller.register_new_user(wallet)
+            self.controller.add_utxo(WalletFactory.STARTING_AMOUNT, wallet.address)
+
+            wallets[wallet.address] = wallet
+
+        return wallets
+
+    def run(self, n_blocks):
+        """Send traffic while mining n_blocks, then report on the run
+
+        Returns:
+            :class:`SimulationReport`: Throughput, latency and resource use.
+
+        """
+        traffic = threading.Thread(target=self._send_traffic)
+
+        start = time.perf_counter()
+        traffic.start()
+
+        try:
+            for _ in range(n_blocks):
+                self._mine_next_block()
+        finally:
+            self._stop_evt.set()
+            traffic.join()
+
+        elapsed = time.perf_counter() - start
+
+        return self._report(n_blocks, elapsed)
+
+    def _send_traffic(self):
+        interval = 1 / self._tx_rate if self._tx_rate else 0
+        next_send = time.perf_counter()
+
+        while not self._stop_evt.is_set():
+            if interval:
+                delay = next_send - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                next_send = next_send + interval
+
+            sender = self._take_idle_wallet()
+
+            if sender is None:
+                time.sleep(0.001)
+                continue
+
+            balance = sender.amount
+
+            if balance < 1:
+                # Broke for now, it may still receive transfers
+                self._release_wallet(sender.address)
+                continue
+
+            receiver = self._random.choice(self._addresses)
+            amount = self._random.randint(1, min(balance, 50))
+
+            transaction = sender.create_transaction(receiver, amount)
+
+            self._submitted[blockchain.transaction_id(transaction)] = time.perf_counter()
+            self.blockchain.add_transaction(transaction)
+
+    def _take_idle_wallet(self):
+        with self._idle_lock:
+            if not self._idle:
+                return None
+
+            # Swap the chosen address with the last one to pop in O(1)
+            i = self._random.randrange(len(self._idle))
+            self._idle[i], self._idle[-1] = self._idle[-1], self._idle[i]
+            address = self._idle.pop()
+
+        return self.wallets[address]
+
+    def _release_wallet(self, address):
+        with self._idle_lock:
+            self._idle.append(address)
+
+    def _mine_next_block(self):
+        txs = self.blockchain.get_transactions()[:self._block_size]
+        miners = [f'miner-{i}' for i in range(self._n_miners)]
+
+        mine_block(self.blockchain, miners, self._version, txs)
+
+        confirmed_at = time.perf_counter()
+
+        for transaction in self.blockchain.get_last_block()["tx"]:
+            for utxo in transaction["in"]:
+                self.controller.remove_utxo(utxo)
+
+            for utxo in transaction["out"]:
+                self.controller.add_utxo(utxo["amount"], utxo["rec_addr"])
+
+            submitted_at = self._submitted.pop(blockchain.transaction_id(transaction))
+            self._latencies.append(confirmed_at - submitted_at)
+
+            self._release_wallet(transaction["sender"])
+
+    def _report(self, n_blocks, elapsed):
+        latencies = self._latencies
+
+        if len(latencies) > 1:
+            percentiles = statistics.quantiles(latencies, n=100)
+            p50, p90, p99 = percentiles[49], percentiles[89], percentiles[98]
+        else:
+            p50 = p90 = p99 = latencies[0] if latencies else None
+
+        orphans = self.blockchain.orphans
+        peak_memory_kb = None
+
+        if resource:
+            peak_memory_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+            # Linux reports kilobytes, macOS bytes
+            if sys.platform == 'darwin':
+                peak_memory_kb = peak_memory_kb // 1024
+
+        return SimulationReport(
+            wallets=len(self.wallets),
+            miners=self._n_miners,
+            blocks=n_blocks,
+            transactions=len(latencies),
+            elapsed=elapsed,
+            tx_per_sec=len(latencies) / elapsed,
+            latency_p50=p50,
+            latency_p90=p90,
+            latency_p99=p99,
+            orphan_rate=orphans / (orphans + n_blocks),
+            peak_memory_kb=peak_memory_kb,
+        )
+
+
+def print_report(report):
+    """Prints a simulation report to the console"""
+
+    def seconds(value):
+        return 'n/a' if value is None else f'{value * 1000:.1f}ms'
+
+    print(
+        f'Wallets: {report.wallets}\n'
+        f'Miners: {report.miners}\n'
+        f'Blocks: {report.blocks}\n'
+        f'Transactions confirmed: {report.transactions}\n'
+        f'Elapsed: {report.elapsed:.3f}s\n'
+        f'Tx/s: {report.tx_per_sec:.2f}\n'
+        f'Confirmation latency p50: {seconds(report.latency_p50)}\n'
+        f'Confirmation latency p90: {seconds(report.latency_p90)}\n'
+        f'Confirmation latency p99: {seconds(report.latency_p99)}\n'
+        f'Orphan rate: {report.orphan_rate:.2%}\n'
+        f'Peak memory: '
+        f'{"n/a" if report.peak_memory_kb is None else f"{report.peak_memory_kb} KB"}'
+    )
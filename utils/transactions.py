@@ -0,0 +1,24 @@
+"""
+Contains the canonical encoding and id of a transaction.
+
+"""
+
+
+import hashlib
+import json
+
+
+def encode_transaction(transaction):
+    """Returns the canonical JSON encoding of a transaction
+
+    Signatures are stored as base64 bytes locally but arrive as str
+    from peers, so bytes are decoded to keep both forms hashing the same.
+    """
+    return json.dumps(
+        transaction, sort_keys=True,
+        default=lambda value: value.decode()).encode()
+
+
+def transaction_id(transaction):
+    """Returns the sha256 hex digest identifying a transaction"""
+    return hashlib.sha256(encode_transaction(transaction)).hexdigest()
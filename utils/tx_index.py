@@ -0,0 +1,100 @@
+"""
+Contains the definition of the TransactionIndex class.
+
+"""
+
+
+from collections import deque
+from itertools import islice
+
+from transactions import transaction_id
+
+
+def transaction_addresses(transaction):
+    """Returns every wallet address a transaction touches, in a stable order"""
+    addresses = [transaction.get('sender'), transaction.get('receiver')]
+    addresses.extend(utxo.get('rec_addr') for utxo in transaction.get('out', []))
+
+    return list(dict.fromkeys(addr for addr in addresses if addr is not None))
+
+
+class TransactionIndex:
+
+    """Secondary index over the transactions stored in the blockchain
+
+    Maps every txid to its (block height, position in the block's tx
+    list) and every address to a posting list of txids, in chain order.
+    Blocks are added as they are appended to the chain and removed when
+    their bodies are pruned, so lookups never have to scan the chain.
+    """
+
+    def __init__(self):
+        self._locations = {}
+        self._by_address = {}
+
+    def __contains__(self, txid):
+        return txid in self._locations
+
+    def __len__(self):
+        return len(self._locations)
+
+    def add_block(self, block, height):
+        """Index every transaction of a block appended at the given height
+
+        A transaction already on the chain keeps its first location.
+        """
+        for entry in self.block_entries(block, height):
+            if entry["txid"] in self._locations:
+                continue
+
+            self._locations[entry["txid"]] = (height, entry["position"])
+
+            for address in entry["addresses"]:
+                self._by_address.setdefault(address, deque()).append(entry["txid"])
+
+    def remove_block(self, block, height):
+        """Drop the transactions of a pruned block from the index"""
+        for entry in self.block_entries(block, height):
+            # Only entries first indexed in this block belong to it
+            if self._locations.get(entry["txid"]) != (height, entry["position"]):
+                continue
+
+            del self._locations[entry["txid"]]
+
+            for address in entry["addresses"]:
+                txids = self._by_address[address]
+
+                # Blocks are pruned oldest first, so this is usually the head
+                if txids[0] == entry["txid"]:
+                    txids.popleft()
+                else:
+                    txids.remove(entry["txid"])
+
+                if not txids:
+                    del self._by_address[address]
+
+    @staticmethod
+    def block_entries(block, height):
+        """Returns the index entries of a block, as persisted by the controller"""
+        return [
+            {
+                'txid': transaction_id(transaction),
+                'height': height,
+                'position': position,
+                'addresses': transaction_addresses(transaction),
+            }
+            for position, transaction in enumerate(block.get("tx", []))
+        ]
+
+    def get_location(self, txid):
+        """Returns the (height, position) of a transaction, or None if unknown"""
+        return self._locations.get(txid)
+
+    def get_history(self, address, limit=20):
+        """Returns up to limit txids involving an address, newest first.
+
+        A limit of None returns the full history.
+        """
+        txids = self._by_address.get(address, deque())
+
+        return list(islice(reversed(txids), limit))
@@ -7,7 +7,6 @@ Contains the definition of the Wallet class.
 import hashlib
 import base64
 import json
-import ecdsa
 
 
 def encode_transaction(transaction):
@@ -100,6 +99,8 @@ class Wallet:
             The base64 encoded transaction signature
          """
 
+        import ecdsa
+
         enc_tx = encode_transaction(new_tx)
 
         # When the key pair is created we convert the private key to hex. from_string requires
@@ -130,6 +131,8 @@ class Wallet:
 
 
         """
+        import ecdsa
+
         # When the key pair is created we encode the public key in base64 to create a shorter
         # key. Before reconstructing, using from_string(), we must decode it. Otherwise we will get
         # a malformed key error thrown.